@@ -21,9 +21,9 @@ class App(tk.Tk):
         self.comp_var = tk.StringVar(value='PL')
         ttk.Entry(frm, textvariable=self.comp_var, width=8).grid(row=1, column=0)
 
-        ttk.Label(frm, text='Season (optional)').grid(row=0, column=1)
+        ttk.Label(frm, text='Season(s) (optional, e.g. 2022,2023)').grid(row=0, column=1)
         self.season_var = tk.StringVar(value='2023')
-        ttk.Entry(frm, textvariable=self.season_var, width=8).grid(row=1, column=1)
+        ttk.Entry(frm, textvariable=self.season_var, width=16).grid(row=1, column=1)
 
         ttk.Button(frm, text='Fetch from football-data.org', command=self.fetch_fd).grid(row=1, column=2, padx=6)
         ttk.Button(frm, text='Load openfootball folder', command=self.load_openfootball).grid(row=1, column=3, padx=6)
@@ -48,6 +48,8 @@ class App(tk.Tk):
     def fetch_fd(self):
         comp = self.comp_var.get().strip()
         season = self.season_var.get().strip() or None
+        if season and ',' in season:
+            season = [s.strip() for s in season.split(',') if s.strip()]
         api = os.getenv('FOOTBALL_DATA_API_KEY')
 
         if not api:
@@ -86,8 +88,19 @@ class App(tk.Tk):
             messagebox.showinfo('No models', 'Train models first.')
             return
 
-        preds = predict_for_upcoming(self.ds, self.models)
+        models = self.models
 
+        def job():
+            try:
+                preds = list(predict_for_upcoming(self.ds, models))
+            except Exception as e:
+                self.after(0, self.log_print, 'Error: ' + str(e))
+                return
+            self.after(0, self._populate_tree, preds)
+
+        threading.Thread(target=job, daemon=True).start()
+
+    def _populate_tree(self, preds):
         if not preds:
             messagebox.showinfo('No upcoming matches', 'No upcoming matches found.')
             return
@@ -105,22 +118,25 @@ class App(tk.Tk):
 
         tree.pack(fill='both', expand=True)
 
-        for p in preds:
-            top = p['pred']['top_scores'][0][0]
-            tree.insert(
-                '',
-                'end',
-                values=(
-                    p['date'],
-                    p['competition'],
-                    p['home'],
-                    p['away'],
-                    f"{p['pred']['p_win']:.2f}",
-                    f"{p['pred']['p_draw']:.2f}",
-                    f"{p['pred']['p_loss']:.2f}",
-                    f"{top[0]}-{top[1]}"
-                )
+        rows = [
+            (
+                p['date'],
+                p['competition'],
+                p['home'],
+                p['away'],
+                f"{p['pred']['p_win']:.2f}",
+                f"{p['pred']['p_draw']:.2f}",
+                f"{p['pred']['p_loss']:.2f}",
+                "{}-{}".format(*p['pred']['top_scores'][0][0])
             )
+            for p in preds
+        ]
+
+        # Hide all columns while bulk-inserting so the tree lays out once
+        tree.configure(displaycolumns=())
+        for values in rows:
+            tree.insert('', 'end', values=values)
+        tree.configure(displaycolumns='#all')
 
 if __name__ == '__main__':
     app = App()
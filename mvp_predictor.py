@@ -1,24 +1,93 @@
-import os, math, sqlite3, json
+import os, sys, math, sqlite3, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from collections import defaultdict
+from collections.abc import MutableMapping
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
-from scipy.stats import poisson
+
+try:
+    import numba
+    from numba import prange
+except ImportError:  # optional: kernels fall back to plain Python
+    numba = None
+    prange = range
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # optional: stdlib json also accepts bytes
+    _json_loads = json.loads
 
 DB_FILE = 'matches.db'
+INSERT_CHUNK = 10000
+
+# Scoreline grid 0..GRID_GOALS-1 goals per side; goal-count and k! tables
+# are built once at import
+GRID_GOALS = 7
+_K = np.arange(GRID_GOALS)
+_LOG_FACT = np.array([math.lgamma(k + 1) for k in range(GRID_GOALS)])
+_FACT = np.exp(_LOG_FACT)
+_TOP_N = 6
+# Scorelines are ranked on probability rounded to 12 digits, then grid
+# order, so last-bit noise between kernels cannot reorder exact ties
+_TIE_SCALE = 1e12
+
+
+def _njit(**kwargs):
+    if numba is None:
+        return lambda f: f
+    # Frozen (PyInstaller) builds have no source files to key the cache on
+    return numba.njit(cache=not getattr(sys, 'frozen', False), **kwargs)
 
 
 # ============================================================
 # Database
 # ============================================================
 
+# Only dated rows take part in the unique match key; dateless rows cannot be
+# told apart reliably, so they are always kept
+_DATED = "date IS NOT NULL AND date <> ''"
+
+_INSERT = '''
+INSERT INTO matches (date, competition, season, home_team, away_team, home_goals, away_goals)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Re-ingesting a dated match fills in its score instead of duplicating it;
+# unchanged rows are left alone so they do not count as written
+_UPSERT = _INSERT + f'''
+ON CONFLICT(date, competition, season, home_team, away_team) WHERE {_DATED} DO UPDATE SET
+    home_goals=COALESCE(excluded.home_goals, home_goals),
+    away_goals=COALESCE(excluded.away_goals, away_goals)
+WHERE COALESCE(excluded.home_goals, home_goals) IS NOT home_goals
+   OR COALESCE(excluded.away_goals, away_goals) IS NOT away_goals
+'''
+
+
 class DataStore:
     def __init__(self, path=DB_FILE):
         self.conn = sqlite3.connect(path, check_same_thread=False)
+        # GUI workers share this connection; writers hold the lock for the
+        # whole transaction so one thread's rows never land in another's
+        self._write_lock = threading.RLock()
+        self._in_bulk = False
+        self._upsert = False
         self._ensure()
 
     def _ensure(self):
         c = self.conn.cursor()
+
+        # WAL + NORMAL sync keeps ingest commits cheap while staying crash-safe
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.execute("PRAGMA temp_store=MEMORY")
+        c.execute("PRAGMA cache_size=-65536")
+        c.execute("PRAGMA mmap_size=268435456")
+
         c.execute('''
         CREATE TABLE IF NOT EXISTS matches (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,15 +99,112 @@ class DataStore:
             home_goals INTEGER,
             away_goals INTEGER
         )''')
+        c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_matches_comp_season
+        ON matches(competition, season, home_goals)
+        ''')
+
+        # Lossless clean-up only: drop dated rows that are identical in every
+        # column, then key matches on (date, competition, season, teams).
+        # Dateless rows are never deduplicated. If conflicting copies of a
+        # match remain (e.g. a fixture and its later result), nothing more is
+        # deleted; dedupe_matches() is the explicit, opt-in way to merge them
+        c.execute("DROP INDEX IF EXISTS ux_matches")
+        c.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='ux_matches_season'")
+        if c.fetchone() is None:
+            c.execute(f'''
+            DELETE FROM matches WHERE {_DATED} AND id NOT IN (
+                SELECT MIN(id) FROM matches
+                GROUP BY date, competition, season, home_team, away_team, home_goals, away_goals
+            )''')
+            self._create_unique_index(c)
+        else:
+            self._upsert = True
         self.conn.commit()
 
+    def _create_unique_index(self, c):
+        # Upserts need the index; without it add_matches falls back to INSERT
+        try:
+            c.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_matches_season
+            ON matches(date, competition, season, home_team, away_team)
+            WHERE {_DATED}
+            ''')
+            self._upsert = True
+        except sqlite3.IntegrityError:
+            self._upsert = False
+
+    def dedupe_matches(self):
+        """Opt-in: keep only the newest copy of each dated match, then enable upserts.
+
+        Returns the number of rows deleted.
+        """
+        with self._write_lock:
+            c = self.conn.cursor()
+            c.execute(f'''
+            DELETE FROM matches WHERE {_DATED} AND id NOT IN (
+                SELECT MAX(id) FROM matches WHERE {_DATED}
+                GROUP BY date, competition, season, home_team, away_team
+            )''')
+            deleted = c.rowcount
+            self._create_unique_index(c)
+            self.conn.commit()
+            return deleted
+
     def add_match(self, date, competition, season, home, away, hg, ag):
-        c = self.conn.cursor()
-        c.execute('''
-        INSERT INTO matches (date, competition, season, home_team, away_team, home_goals, away_goals)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (date, competition, season, home, away, hg, ag))
-        self.conn.commit()
+        return self.add_matches([(date, competition, season, home, away, hg, ag)])
+
+    def add_matches(self, rows):
+        """Insert or update many (date, competition, season, home, away, hg, ag) rows in one transaction.
+
+        Returns the number of rows inserted or changed.
+        """
+        with self._write_lock:
+            before = self.conn.total_changes
+            try:
+                self.conn.executemany(_UPSERT if self._upsert else _INSERT, rows)
+            except Exception:
+                if not self._in_bulk:
+                    self.conn.rollback()
+                raise
+
+            if not self._in_bulk:
+                self.conn.commit()
+            return self.conn.total_changes - before
+
+    @contextmanager
+    def savepoint(self, name="sp"):
+        """Undo everything done inside the block if it raises, without ending the transaction."""
+        with self._write_lock:
+            self.conn.execute(f"SAVEPOINT {name}")
+            try:
+                yield self
+            except Exception:
+                self.conn.execute(f"ROLLBACK TO {name}")
+                self.conn.execute(f"RELEASE {name}")
+                raise
+            self.conn.execute(f"RELEASE {name}")
+
+    @contextmanager
+    def bulk(self):
+        """Group every insert made inside the block into a single commit."""
+        with self._write_lock:
+            # Only the lock holder can be in bulk, so this is a nested block
+            if self._in_bulk:
+                yield self
+                return
+
+            self._in_bulk = True
+            try:
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN")
+                yield self
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                self._in_bulk = False
 
     def list_matches(self, competition=None, season=None, limit=None):
         c = self.conn.cursor()
@@ -66,11 +232,100 @@ class DataStore:
         c.execute(q, params)
         return c.fetchall()
 
+    def load_training_arrays(self, competition=None, season=None):
+        """Completed matches as column arrays (home, away, home_goals, away_goals)."""
+        c = self.conn.cursor()
+        c.arraysize = 10000
+
+        q = "SELECT home_team, away_team, home_goals, away_goals FROM matches WHERE home_goals IS NOT NULL"
+        params = []
+
+        if competition:
+            q += " AND competition=?"
+            params.append(competition)
+
+        if season:
+            q += " AND season=?"
+            params.append(season)
+
+        q += " ORDER BY date ASC"
+        c.execute(q, params)
+
+        home, away, hg, ag = [], [], [], []
+        while True:
+            chunk = c.fetchmany()
+            if not chunk:
+                break
+            for h, a, x, y in chunk:
+                home.append(h)
+                away.append(a)
+                hg.append(x)
+                ag.append(y)
+
+        hg = np.array(hg, dtype=float)
+        ag = np.array(ag, dtype=float)
+        done = ~(np.isnan(hg) | np.isnan(ag))
+
+        return (
+            np.array(home, dtype=object)[done],
+            np.array(away, dtype=object)[done],
+            hg[done].astype(np.int16),
+            ag[done].astype(np.int16),
+        )
+
+    def aggregate_strengths(self, competition=None, season=None):
+        """Poisson strengths (atk, defn, avg_goals) from per-team SQL aggregates."""
+        where = "home_goals IS NOT NULL AND away_goals IS NOT NULL"
+        params = []
+
+        if competition:
+            where += " AND competition=?"
+            params.append(competition)
+
+        if season:
+            where += " AND season=?"
+            params.append(season)
+
+        totals = defaultdict(lambda: [0, 0, 0])
+        for team, scored, conceded in (("home_team", "home_goals", "away_goals"),
+                                       ("away_team", "away_goals", "home_goals")):
+            c = self.conn.execute(f"""
+            SELECT {team}, SUM({scored}), SUM({conceded}), COUNT(*)
+            FROM matches WHERE {where} GROUP BY {team}
+            """, params)
+            for name, s, a, n in c:
+                t = totals[name]
+                t[0] += s
+                t[1] += a
+                t[2] += n
+
+        teams = sorted(totals)
+        cols = np.array([totals[t] for t in teams], dtype=float).reshape(len(teams), 3)
+        return _strengths_from_totals(teams, cols[:, 0], cols[:, 1], cols[:, 2])
+
 
 # ============================================================
 # Football-data.org ingestion
 # ============================================================
 
+# Shared keep-alive session so repeated fetches reuse the TCP/TLS connection
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+
+def _dig(d, *keys):
+    """Follow keys through nested dicts; None as soon as a level is missing."""
+    for k in keys:
+        if not isinstance(d, dict):
+            return None
+        d = d.get(k)
+    return d
+
+
 def fetch_from_football_data(comp, season=None, api_key=None):
     if api_key is None:
         api_key = os.getenv("FOOTBALL_DATA_API_KEY")
@@ -82,23 +337,21 @@ def fetch_from_football_data(comp, season=None, api_key=None):
     if season:
         params['season'] = season
 
-    r = requests.get(url, headers=headers, params=params, timeout=30)
+    r = _SESSION.get(url, headers=headers, params=params, timeout=30)
     r.raise_for_status()
 
     items = []
 
-    for m in r.json().get('matches', []):
-        date = m.get('utcDate', '')[:10]
-        home = m.get('homeTeam', {}).get('name')
-        away = m.get('awayTeam', {}).get('name')
-
-        score = m.get('score', {}).get('fullTime', {})
-        hg = score.get('home')
-        ag = score.get('away')
+    for m in _json_loads(r.content).get('matches', []):
+        date = (m.get('utcDate') or '')[:10]
+        home = _dig(m, 'homeTeam', 'name')
+        away = _dig(m, 'awayTeam', 'name')
+        hg = _dig(m, 'score', 'fullTime', 'home')
+        ag = _dig(m, 'score', 'fullTime', 'away')
 
         # Extract season year
         season_year = None
-        s = m.get('season', {}).get('startDate')
+        s = _dig(m, 'season', 'startDate')
         if s:
             try:
                 season_year = int(s[:4])
@@ -110,12 +363,28 @@ def fetch_from_football_data(comp, season=None, api_key=None):
     return items
 
 
-def ingest_football_data_competition(ds, comp, season=None, api_key=None):
-    data = fetch_from_football_data(comp, season=season, api_key=api_key)
+def fetch_many_from_football_data(pairs, api_key=None, max_workers=4):
+    """Fetch several (comp, season) pairs concurrently; results keep the input order."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(lambda cs: fetch_from_football_data(cs[0], season=cs[1], api_key=api_key), pairs)
+        return [item for items in results for item in items]
+
 
-    for date, comp, season_year, home, away, hg, ag in data:
-        if home and away:
-            ds.add_match(date, comp, season_year or 0, home, away, hg, ag)
+def ingest_football_data_competition(ds, comp, season=None, api_key=None):
+    """season may be a single season or a list of seasons fetched in parallel."""
+    if isinstance(season, (list, tuple)):
+        data = fetch_many_from_football_data([(comp, s) for s in season], api_key=api_key)
+    else:
+        data = fetch_from_football_data(comp, season=season, api_key=api_key)
+
+    batch = [
+        (date, comp, season_year or 0, home, away, hg, ag)
+        for date, comp, season_year, home, away, hg, ag in data
+        if home and away
+    ]
+    with ds.bulk():
+        for i in range(0, len(batch), INSERT_CHUNK):
+            ds.add_matches(batch[i:i + INSERT_CHUNK])
 
     return len(data)
 
@@ -125,37 +394,44 @@ def ingest_football_data_competition(ds, comp, season=None, api_key=None):
 # ============================================================
 
 def ingest_openfootball_folder(ds, folder):
-    """Load matches from newline-delimited JSON files."""
-    total = 0
-
+    """Load matches from newline-delimited JSON files; returns rows inserted or updated."""
+    # Read and parse every file before taking the write lock, so disk I/O
+    # and JSON decoding never hold the shared connection's transaction open
+    batches = []
     for fname in os.listdir(folder):
         path = os.path.join(folder, fname)
         if not os.path.isfile(path):
             continue
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    j = json.loads(line)
-
-                    date = j.get("date")
-                    competition = j.get("competition", "OPEN")
-                    season = j.get("season", 0)
-                    home = j.get("home")
-                    away = j.get("away")
-                    hg = j.get("home_goals")
-                    ag = j.get("away_goals")
-
-                    if home and away:
-                        ds.add_match(date, competition, season, home, away, hg, ag)
-                        total += 1
+            with open(path, "rb") as f:
+                data = f.read()
+
+            records = [_json_loads(line) for line in data.splitlines() if line.strip()]
+            batches.append((path, [
+                (j.get("date"), j.get("competition", "OPEN"), j.get("season", 0),
+                 j.get("home"), j.get("away"), j.get("home_goals"), j.get("away_goals"))
+                for j in records
+                if j.get("home") and j.get("away")
+            ]))
 
         except Exception as e:
             print("Skipping file:", path, "Error:", e)
 
+    total = 0
+    with ds.bulk():
+        for path, batch in batches:
+            try:
+                # A file that fails part-way leaves none of its rows behind
+                written = 0
+                with ds.savepoint("ingest_file"):
+                    for i in range(0, len(batch), INSERT_CHUNK):
+                        written += ds.add_matches(batch[i:i + INSERT_CHUNK])
+                total += written
+
+            except Exception as e:
+                print("Skipping file:", path, "Error:", e)
+
     return total
 
 
@@ -163,18 +439,73 @@ def ingest_openfootball_folder(ds, folder):
 # Elo rating
 # ============================================================
 
+class _RatingsView(MutableMapping):
+    """Live team -> rating mapping over an EloRatings array.
+
+    Like the old defaultdict, reading an unknown team registers it at the
+    base rating. Writes go straight to the array; teams cannot be removed.
+    """
+
+    def __init__(self, elo):
+        self._elo = elo
+
+    def __getitem__(self, team):
+        i = self._elo._id(team)  # may grow the array, so look it up first
+        return float(self._elo.values[i])
+
+    def __setitem__(self, team, rating):
+        i = self._elo._id(team)
+        self._elo.values[i] = rating
+
+    def __delitem__(self, team):
+        raise TypeError("Elo ratings cannot be removed")
+
+    def __iter__(self):
+        return iter(self._elo.team_index)
+
+    def __len__(self):
+        return len(self._elo.team_index)
+
+
 class EloRatings:
-    def __init__(self, k=20, base=1500):
+    """Elo ratings stored in a float array, indexed by team id via team_index."""
+
+    def __init__(self, k=20, base=1500, teams=()):
         self.k = k
-        self.ratings = defaultdict(lambda: base)
+        self.base = base
+        self.team_index = {t: i for i, t in enumerate(teams)}
+        self.values = np.full(len(self.team_index), float(base))
+
+    def _id(self, team):
+        i = self.team_index.get(team)
+        if i is None:
+            i = self.team_index[team] = len(self.team_index)
+            if i >= len(self.values):
+                grow = np.full(max(len(self.values), 16), float(self.base))
+                self.values = np.concatenate([self.values, grow])
+        return i
+
+    @property
+    def ratings(self):
+        """Live, writable team -> rating view; unknown teams read as the base rating."""
+        return _RatingsView(self)
+
+    def rating(self, team):
+        i = self.team_index.get(team)
+        return self.base if i is None else float(self.values[i])
+
+    def __getitem__(self, team):
+        return self.rating(team)
+
+    def _expected(self, i, j):
+        return 1.0 / (1 + 10.0 ** ((self.values[j] - self.values[i]) * 0.0025))
 
     def expected(self, a, b):
-        ra = self.ratings[a]
-        rb = self.ratings[b]
-        return 1 / (1 + 10 ** ((rb - ra) / 400))
+        return self._expected(self._id(a), self._id(b))
 
     def update(self, a, b, a_goals, b_goals):
-        ea = self.expected(a, b)
+        i, j = self._id(a), self._id(b)
+        ea = self._expected(i, j)
 
         if a_goals > b_goals:
             sa = 1.0
@@ -183,104 +514,226 @@ class EloRatings:
         else:
             sa = 0.0
 
-        self.ratings[a] += self.k * (sa - ea)
-        self.ratings[b] += self.k * ((1 - sa) - (1 - ea))
-
+        self.values[i] += self.k * (sa - ea)
+        self.values[j] += self.k * ((1 - sa) - (1 - ea))
 
-# ============================================================
-# Poisson strength modeling
-# ============================================================
-
-def fit_poisson_strengths(matches):
-    teams = set()
-    for m in matches:
-        teams.add(m[3])
-        teams.add(m[4])
-
-    attack = defaultdict(float)
-    defense = defaultdict(float)
-    games = defaultdict(int)
-
-    for m in matches:
-        home, away, hg, ag = m[3], m[4], m[5], m[6]
-        if hg is None or ag is None:
-            continue
 
-        attack[home] += hg
-        defense[home] += ag
-        games[home] += 1
+@_njit()
+def _run_elo(home_ids, away_ids, hg, ag, n_teams, k, base):
+    """Same update rule as EloRatings.update, over integer team ids."""
+    ratings = np.full(n_teams, base, dtype=np.float64)
 
-        attack[away] += ag
-        defense[away] += hg
-        games[away] += 1
+    for i in range(home_ids.shape[0]):
+        a = home_ids[i]
+        b = away_ids[i]
+        ea = 1.0 / (1.0 + 10.0 ** ((ratings[b] - ratings[a]) * 0.0025))
 
-    total_goals = sum(attack.values())
-    total_games = sum(games.values()) if sum(games.values()) > 0 else 1
-    avg_goals = total_goals / total_games
-
-    atk = {}
-    defn = {}
-
-    for t in teams:
-        if games[t] > 0:
-            atk[t] = (attack[t] / games[t]) / avg_goals
-            defn[t] = (defense[t] / games[t]) / avg_goals
+        if hg[i] > ag[i]:
+            sa = 1.0
+        elif hg[i] == ag[i]:
+            sa = 0.5
         else:
-            atk[t] = 1.0
-            defn[t] = 1.0
-
-    return atk, defn, avg_goals
-
+            sa = 0.0
 
-def predict_match_poisson(home, away, atk, defn, avg_goals, home_adv=1.05):
-    lam_h = avg_goals * atk.get(home, 1.0) * defn.get(away, 1.0) * home_adv
-    lam_a = avg_goals * atk.get(away, 1.0) * defn.get(home, 1.0)
+        ratings[a] += k * (sa - ea)
+        ratings[b] += k * ((1 - sa) - (1 - ea))
 
-    scores = []
-    for gh in range(7):
-        for ga in range(7):
-            p = poisson.pmf(gh, lam_h) * poisson.pmf(ga, lam_a)
-            scores.append(((gh, ga), p))
+    return ratings
 
-    scores.sort(key=lambda x: -x[1])
 
-    p_win = sum(p for (s, p) in scores if s[0] > s[1])
-    p_draw = sum(p for (s, p) in scores if s[0] == s[1])
-    p_loss = sum(p for (s, p) in scores if s[0] < s[1])
+# ============================================================
+# Poisson strength modeling
+# ============================================================
 
+def _team_ids(home, away):
+    """Factorise team names into (teams, home_ids, away_ids)."""
+    teams, idx = np.unique(np.concatenate([home, away]), return_inverse=True)
+    return teams, idx[:len(home)], idx[len(home):]
+
+
+def fit_poisson_strengths(home, away, hg, ag):
+    """Attack/defence strengths from completed-match arrays (see load_training_arrays).
+
+    In-memory counterpart of DataStore.aggregate_strengths, for match data
+    that is not in the database.
+    """
+    teams, h_idx, a_idx = _team_ids(home, away)
+    n = len(teams)
+
+    attack = np.bincount(h_idx, weights=hg, minlength=n) + np.bincount(a_idx, weights=ag, minlength=n)
+    defense = np.bincount(h_idx, weights=ag, minlength=n) + np.bincount(a_idx, weights=hg, minlength=n)
+    games = np.bincount(h_idx, minlength=n) + np.bincount(a_idx, minlength=n)
+
+    return _strengths_from_totals(teams.tolist(), attack, defense, games)
+
+
+def _strengths_from_totals(teams, attack, defense, games):
+    """Turn per-team goals scored/conceded and games played into strengths."""
+    n = len(teams)
+    total_games = games.sum() if games.sum() > 0 else 1
+    avg_goals = float(attack.sum() / total_games)
+
+    # A league with no goals at all keeps neutral strengths of 1.0
+    scale = games * avg_goals
+    atk = np.divide(attack, scale, out=np.ones(n), where=scale > 0)
+    defn = np.divide(defense, scale, out=np.ones(n), where=scale > 0)
+
+    return dict(zip(teams, atk.tolist())), dict(zip(teams, defn.tolist())), avg_goals
+
+
+def _strength_tables(atk, defn, teams):
+    """(team_index, atk_pow, defn_pow) for teams, with k-th powers of each strength.
+
+    lam**k = (avg * atk * defn)**k factorises per team, so the powers are
+    tabulated once per team rather than per fixture. The extra trailing row is
+    the neutral 1.0 used for teams missing from atk/defn.
+    """
+    team_index = {t: i for i, t in enumerate(teams)}
+    atk_arr = np.array([atk.get(t, 1.0) for t in team_index] + [1.0])
+    defn_arr = np.array([defn.get(t, 1.0) for t in team_index] + [1.0])
+    return team_index, atk_arr[:, None] ** _K, defn_arr[:, None] ** _K
+
+
+def _marginals_from_ids(tables, avg_goals, h_ids, a_ids, home_adv):
+    """Goal rates and (N, GRID_GOALS) Poisson marginals for fixtures given as team ids."""
+    _, atk_pow, defn_pow = tables
+    # Column 1 of a power table is the strength itself
+    lam_h = avg_goals * atk_pow[h_ids, 1] * defn_pow[a_ids, 1] * home_adv
+    lam_a = avg_goals * atk_pow[a_ids, 1] * defn_pow[h_ids, 1]
+
+    # P(k) = e^-lam * (avg*adv)^k / k! * atk_h^k * defn_a^k: one exp per side
+    ph = np.exp(-lam_h)[:, None] * ((avg_goals * home_adv) ** _K / _FACT) * atk_pow[h_ids] * defn_pow[a_ids]
+    pa = np.exp(-lam_a)[:, None] * (avg_goals ** _K / _FACT) * atk_pow[a_ids] * defn_pow[h_ids]
+    return lam_h, lam_a, ph, pa
+
+
+def _poisson_batch(ph, pa):
+    """Score N fixtures at once from their (N, GRID_GOALS) goal marginals."""
+    M = ph[:, :, None] * pa[:, None, :]
+
+    p_win = np.tril(M, -1).sum(axis=(1, 2))
+    p_draw = np.diagonal(M, axis1=1, axis2=2).sum(axis=1)
+    p_loss = np.triu(M, 1).sum(axis=(1, 2))
+
+    cells = GRID_GOALS * GRID_GOALS
+    flat = M.reshape(len(M), cells)
+    # Unique integer key: rounded probability first, lower grid index wins ties
+    key = np.floor(flat * _TIE_SCALE + 0.5).astype(np.int64) * cells + (cells - 1 - np.arange(cells))
+    top = np.argpartition(-key, _TOP_N - 1, axis=1)[:, :_TOP_N]
+    order = np.argsort(-np.take_along_axis(key, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_p = np.take_along_axis(flat, top, axis=1)
+
+    return p_win, p_draw, p_loss, top, top_p
+
+
+@_njit(parallel=True, fastmath=True)
+def _predict_batch(ph_all, pa_all, out_pwin, out_pdraw, out_ploss, out_top, out_top_p):
+    """Per-fixture 7x7 loop version of _poisson_batch, parallel across fixtures."""
+    for n in prange(ph_all.shape[0]):
+        ph = ph_all[n]
+        pa = pa_all[n]
+
+        p_win = 0.0
+        p_draw = 0.0
+        p_loss = 0.0
+        top = out_top[n]
+        top_p = out_top_p[n]
+        top_key = np.full(_TOP_N, -1, dtype=np.int64)
+        cells = GRID_GOALS * GRID_GOALS
+        for gh in range(GRID_GOALS):
+            for ga in range(GRID_GOALS):
+                p = ph[gh] * pa[ga]
+                if gh > ga:
+                    p_win += p
+                elif gh == ga:
+                    p_draw += p
+                else:
+                    p_loss += p
+
+                # Insertion into the descending top-N buffer, ranked on the
+                # same rounded-probability/grid-index key as _poisson_batch
+                idx = gh * GRID_GOALS + ga
+                key = np.int64(math.floor(p * _TIE_SCALE + 0.5)) * cells + (cells - 1 - idx)
+                if key > top_key[_TOP_N - 1]:
+                    j = _TOP_N - 1
+                    while j > 0 and key > top_key[j - 1]:
+                        top_key[j] = top_key[j - 1]
+                        top_p[j] = top_p[j - 1]
+                        top[j] = top[j - 1]
+                        j -= 1
+                    top_key[j] = key
+                    top_p[j] = p
+                    top[j] = idx
+
+        out_pwin[n] = p_win
+        out_pdraw[n] = p_draw
+        out_ploss[n] = p_loss
+
+
+def _score_fixtures(ph, pa):
+    """Dispatch to the Numba kernel when available, else the NumPy one."""
+    if numba is None:
+        return _poisson_batch(ph, pa)
+
+    ph = np.ascontiguousarray(ph, dtype=np.float64)
+    pa = np.ascontiguousarray(pa, dtype=np.float64)
+    n = len(ph)
+    p_win, p_draw, p_loss = np.empty(n), np.empty(n), np.empty(n)
+    top = np.empty((n, _TOP_N), dtype=np.int64)
+    top_p = np.empty((n, _TOP_N))
+    _predict_batch(ph, pa, p_win, p_draw, p_loss, top, top_p)
+    return p_win, p_draw, p_loss, top, top_p
+
+
+def _prediction(lam_h, lam_a, p_win, p_draw, p_loss, top, top_p):
     return {
         "lambda_home": lam_h,
         "lambda_away": lam_a,
-        "top_scores": scores[:6],
+        "top_scores": [(divmod(int(i), GRID_GOALS), p) for i, p in zip(top, top_p)],
         "p_win": p_win,
         "p_draw": p_draw,
         "p_loss": p_loss
     }
 
 
+def predict_match_poisson(home, away, atk, defn, avg_goals, home_adv=1.05):
+    tables = _strength_tables(atk, defn, [home, away])
+    index = tables[0]
+    lam_h, lam_a, ph, pa = _marginals_from_ids(tables, avg_goals, [index[home]], [index[away]], home_adv)
+
+    p_win, p_draw, p_loss, top, top_p = _score_fixtures(ph, pa)
+    return _prediction(lam_h[0], lam_a[0], p_win[0], p_draw[0], p_loss[0], top[0], top_p[0])
+
+
 # ============================================================
 # Model building & prediction
 # ============================================================
 
 def build_models(ds, competition=None, season=None):
-    matches = ds.list_matches(competition=competition, season=season)
-    complete = [m for m in matches if m[5] is not None and m[6] is not None]
-
-    atk, defn, avg = fit_poisson_strengths(complete)
-
-    elo = EloRatings()
-    for m in complete:
-        elo.update(m[3], m[4], m[5], m[6])
+    # Poisson strengths only need per-team sums, which SQLite aggregates;
+    # Elo is order-dependent so it still walks the individual matches
+    atk, defn, avg = ds.aggregate_strengths(competition=competition, season=season)
+    home, away, hg, ag = ds.load_training_arrays(competition=competition, season=season)
+
+    teams, h_idx, a_idx = _team_ids(home, away)
+    elo = EloRatings(teams=teams.tolist())
+    elo.values = _run_elo(
+        h_idx.astype(np.int32), a_idx.astype(np.int32), hg, ag,
+        len(teams), float(elo.k), float(elo.base),
+    )
 
     return {
         "atk": atk,
         "defn": defn,
         "avg_goals": avg,
-        "elo": elo
+        "elo": elo,
+        "tables": _strength_tables(atk, defn, teams.tolist())
     }
 
 
 def predict_for_upcoming(ds, models, competition=None, season=None):
+    """Lazily produce a prediction dict for every fixture without a result."""
     c = ds.conn.cursor()
     q = "SELECT date, competition, season, home_team, away_team FROM matches WHERE home_goals IS NULL"
     params = []
@@ -290,17 +743,40 @@ def predict_for_upcoming(ds, models, competition=None, season=None):
         params.append(competition)
 
     c.execute(q, params)
-    rows = c.fetchall()
-
-    out = []
-    for date, comp, s, home, away in rows:
-        pred = predict_match_poisson(home, away, models['atk'], models['defn'], models['avg_goals'])
-        out.append({
-            "date": date,
-            "competition": comp,
-            "home": home,
-            "away": away,
-            "pred": pred
-        })
-
-    return out
+
+    # Stream the cursor; only team ids and the display fields are kept
+    # Models built elsewhere may lack the precomputed tables
+    tables = models.get('tables') or _strength_tables(models['atk'], models['defn'], list(models['atk']))
+    index = tables[0]
+    unknown = len(index)
+    dates, comps, homes, aways, h_list, a_list = [], [], [], [], [], []
+    for date, comp, s, home, away in c:
+        dates.append(date)
+        comps.append(comp)
+        homes.append(home)
+        aways.append(away)
+        h_list.append(index.get(home, unknown))
+        a_list.append(index.get(away, unknown))
+    h_ids = np.array(h_list, dtype=np.intp)
+    a_ids = np.array(a_list, dtype=np.intp)
+
+    # Each distinct pairing is scored once
+    pairs, inverse = np.unique(np.stack([h_ids, a_ids], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    uh, ua = pairs[:, 0], pairs[:, 1]
+
+    lam_h, lam_a, ph, pa = _marginals_from_ids(tables, models['avg_goals'], uh, ua, 1.05)
+
+    p_win, p_draw, p_loss, top, top_p = (x[inverse] for x in _score_fixtures(ph, pa))
+    lam_h, lam_a = lam_h[inverse], lam_a[inverse]
+
+    return (
+        {
+            "date": dates[i],
+            "competition": comps[i],
+            "home": homes[i],
+            "away": aways[i],
+            "pred": _prediction(lam_h[i], lam_a[i], p_win[i], p_draw[i], p_loss[i], top[i], top_p[i])
+        }
+        for i in range(len(dates))
+    )